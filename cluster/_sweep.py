@@ -0,0 +1,63 @@
+"""Shared machinery for sweeping circles over a quadtree.
+"""
+
+import typing
+import numpy as np
+from cormode.classical import QuadTreeNode
+
+
+def sweep_circles(
+    root: QuadTreeNode,
+    cx: np.ndarray,
+    cy: np.ndarray,
+    r: np.ndarray,
+    scan_statistic: typing.Callable[[np.ndarray, np.ndarray], np.ndarray],
+) -> np.ndarray:
+    """Computes a scan statistic for each circle, skipping circles that cannot attain the maximum.
+
+    Largest circles are evaluated first to establish a high running maximum. For non-private
+    trees, the remaining circles are only evaluated if an upper bound on their count inside
+    could reach that maximum. This relies on the scan statistic being nondecreasing in the count.
+
+    Args:
+        root (QuadTreeNode): Root of the QuadTreeNode containing spatial counts.
+        cx (np.ndarray): X coordinates of circle centers.
+        cy (np.ndarray): Y coordinates of circle centers.
+        r (np.ndarray): Radii of circles.
+        scan_statistic (typing.Callable[[np.ndarray, np.ndarray], np.ndarray]): Computes the scan statistic from
+            the counts inside a selection of circles and the boolean mask selecting them.
+
+    Returns:
+        np.ndarray: Scan statistic of each circle. Skipped circles are -inf.
+    """
+    scan_statistics = np.full(cx.shape, -np.inf)
+
+    # flatten the tree once for every query below
+    arrays = root.to_soa()
+
+    def evaluate(selection):
+        scan_statistics[selection] = scan_statistic(
+            root.count_inside_circles(
+                cx[selection], cy[selection], r[selection], arrays=arrays
+            ),
+            selection,
+        )
+
+    largest = r == r.max()
+    evaluate(largest)
+
+    remaining = ~largest
+    if root.epsilon is None and remaining.any():
+        # non-private counts are nonnegative and consistent, so the nodes overlapping a circle bound its count
+        upper_bounds = np.zeros(cx.shape)
+        upper_bounds[remaining] = scan_statistic(
+            root.count_inside_upper_bound(
+                cx[remaining], cy[remaining], r[remaining], arrays=arrays
+            ),
+            remaining,
+        )
+        # strict comparison keeps ties, so the first maximizing circle is unchanged
+        remaining &= ~(upper_bounds < np.max(scan_statistics[largest]))
+
+    evaluate(remaining)
+    return scan_statistics
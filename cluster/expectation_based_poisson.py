@@ -3,9 +3,9 @@ in Neill 2006, "Detection of Spatial and Spatio-Temporal Clusters."
 """
 import numpy as np
 import typing
-from shapely import geometry
 from cormode import Point
 from cormode.classical import QuadTreeNode
+from cluster._sweep import sweep_circles
 
 
 def find_max_ebp_sweep(
@@ -33,30 +33,118 @@ def find_max_ebp_sweep(
     """
 
     # area of entire space under consideration
-    total_area = geometry.box(*root.rect).area
+    total_area = (root.rect.xmax - root.rect.xmin) * (root.rect.ymax - root.rect.ymin)
+
+    # enumerate every (x, y, radius) combination in the same order as a nested sweep
+    cx, cy, r = (
+        grid.ravel() for grid in np.meshgrid(center_xs, center_ys, radii, indexing="ij")
+    )
+
+    # TODO: assumption that baseline is uniform across the entire area
+    # ...would need real historical data for this...
+    baseline_per_unit_area = lambda_background / total_area
+    baselines = baseline_per_unit_area * np.pi * r * r
+
+    # compute scan statistic for every region that could be the max
+    scan_statistics = sweep_circles(
+        root,
+        cx,
+        cy,
+        r,
+        lambda counts, selection: ebp_scan_statistic(counts, baselines[selection]),
+    )
 
-    max_scan_statistic = None
-    max_region = None
+    # return max scan statistic we encountered and its associated region
+    best = np.argmax(scan_statistics)
+    return scan_statistics[best], (Point(cx[best], cy[best]), r[best])
 
-    # sweep a circle across the space
-    for x in center_xs:
-        for y in center_ys:
-            for radius in radii:
-                region = geometry.Point(x, y).buffer(radius)
 
-                # TODO: assumption that baseline is uniform across the entire area
-                # ...would need real historical data for this...
-                baseline = lambda_background * (region.area / total_area)
+def find_max_ebp_sweep_multires(
+    root: QuadTreeNode,
+    lambda_background: float,
+    levels=((5, 5, 3), (5, 5, 3)),
+    radius_range=(0.1, 0.25),
+    top_k=4,
+) -> typing.Tuple[float, typing.Tuple[Point, float]]:
+    """Finds the region that maximizes the expectation-based Poisson scan statistic
+    using a coarse-to-fine search instead of an exhaustive sweep.
 
-                # compute scan statistic for this region
-                scan_statistic = ebp_scan_statistic(root.count_inside(region), baseline)
+    The first level sweeps a coarse grid of circles over the whole area. Each following level
+    sweeps a grid of the given shape around each of the top_k circles of the previous level,
+    spanning halfway to the neighboring grid points on either side, so each level only adds
+    circles between the previous level's points. Circles already evaluated are skipped.
 
-                # if it is a new max, record it
-                if max_scan_statistic is None or scan_statistic > max_scan_statistic:
-                    max_scan_statistic = scan_statistic
-                    max_region = (Point(x, y), radius)
+    Args:
+        root (QuadTreeNode): Root of the QuadTreeNode containing spatial counts.
+        lambda_background (float): Poisson parameter of the background distribution assuming no cluster.
+                                    In practice this will be estimated based on prior data.
+        levels (optional): Grid shape (x centers, y centers, radii) of each level. Defaults to ((5, 5, 3), (5, 5, 3)).
+        radius_range (optional): (min, max) radius of sweeping circles. Defaults to (0.1, 0.25).
+        top_k (int, optional): Number of circles from each level to refine in the next. Defaults to 4.
+
+    Returns:
+        typing.Tuple[float, typing.Tuple[Point, float]]: Tuple of (max scan statistic, circle) where circle is a tuple of (center, radius).
+    """
+
+    # area of entire space under consideration
+    total_area = (root.rect.xmax - root.rect.xmin) * (root.rect.ymax - root.rect.ymin)
+
+    # TODO: assumption that baseline is uniform across the entire area
+    baseline_per_unit_area = lambda_background / total_area
+
+    # bounds of the (x, y, radius) search space
+    lower = np.array([root.rect.xmin, root.rect.ymin, radius_range[0]])
+    upper = np.array([root.rect.xmax, root.rect.ymax, radius_range[1]])
+
+    # the first level is a single grid spanning the entire search space
+    half_extent = (upper - lower) / 2
+    focuses = [(lower + upper) / 2]
+
+    evaluated = set()
+    max_scan_statistic = None
+    max_region = None
+
+    for shape in levels:
+        # lay a grid around each focus, skipping circles evaluated on earlier levels
+        candidates = []
+        for focus in focuses:
+            # an axis with a single point sits on the focus itself
+            axes = [
+                np.linspace(max(lo, f - h), min(hi, f + h), n) if n > 1 else [f]
+                for lo, hi, f, h, n in zip(lower, upper, focus, half_extent, shape)
+            ]
+            for circle in np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(
+                -1, 3
+            ):
+                key = tuple(np.round(circle, 12))
+                if key not in evaluated:
+                    evaluated.add(key)
+                    candidates.append(circle)
+
+        if not candidates:
+            break
+
+        candidates = np.array(candidates)
+        cx, cy, r = candidates.T
+        scan_statistics = ebp_scan_statistic(
+            root.count_inside_circles(cx, cy, r), baseline_per_unit_area * np.pi * r * r
+        )
+
+        # refine around the best circles of this level
+        ranking = np.argsort(-scan_statistics, kind="stable")
+        best = ranking[0]
+        if max_scan_statistic is None or scan_statistics[best] > max_scan_statistic:
+            max_scan_statistic = scan_statistics[best]
+            max_region = (Point(cx[best], cy[best]), r[best])
+
+        # next grids reach halfway to this grid's neighboring points;
+        # axes with a single point have no spacing, so they keep their extent
+        focuses = candidates[ranking[:top_k]]
+        shape = np.array(shape)
+        half_extent = np.where(
+            shape > 1, half_extent / np.maximum(shape - 1, 1), half_extent
+        )
 
-    # return max scan statistic we encountered and its associated region
     return max_scan_statistic, max_region
 
 
@@ -66,6 +154,8 @@ def ebp_scan_statistic(count_inside, baseline_inside) -> float:
 
     Reference: Neill, 2006. "Detection of Spatial and Spatio-Temporal Clusters."
 
+    Accepts either scalars or equally-shaped arrays of regions.
+
     Args:
         count_inside (float): Count inside the region.
         baseline_inside (float): Expected count inside of this region, inferred from historical data.
@@ -74,9 +164,10 @@ def ebp_scan_statistic(count_inside, baseline_inside) -> float:
         float: value of EBP scan statistic for this region.
     """
 
-    if count_inside > baseline_inside:
-        return count_inside * np.log(count_inside / baseline_inside) + (
-            baseline_inside - count_inside
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(
+            count_inside > baseline_inside,
+            count_inside * np.log(count_inside / baseline_inside)
+            + (baseline_inside - count_inside),
+            0.0,  # = log(1)
         )
-    else:
-        return 0  # = log(1)
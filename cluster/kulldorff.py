@@ -3,31 +3,39 @@
 
 import typing
 import numpy as np
+from joblib import Parallel, delayed
 from cormode import gen, Point
 from shapely import geometry
 from cormode.classical import QuadTreeNode
+from cluster._sweep import sweep_circles
+
+
+def _one_mc_iteration(lambda_background, population, seed) -> float:
+    rng = np.random.default_rng(seed)
+    # generate some background data
+    points = gen.generate_points_no_cluster(
+        geometry.box(0, 0, 1, 1), lambda_background, rng=rng
+    )
+    # build quadtree
+    tree = QuadTreeNode.from_points(points[:, 0], points[:, 1], height=5)
+    # compute max scan statistic
+    scan_statistic, _ = find_max_kulldorff_sweep(tree, population)
+    return scan_statistic
 
 
 def compute_scan_statistic_threshold(
-    lambda_background, population, significance_level=0.05, iter=1000
+    lambda_background, population, significance_level=0.05, iter=1000, n_jobs=-1
 ):
     # compute scan statistic assuming background parameters
-    scan_statistic_values = []
-    for _ in range(iter):
-        # generate some background data
-        points = gen.generate_points_no_cluster(
-            geometry.box(0, 0, 1, 1), lambda_background
-        )
-        # build quadtree
-        tree = QuadTreeNode(height=5)
-        for x, y in points:
-            tree.insert_point(Point(x, y))
-        # compute max scan statistic
-        scan_statistic, _ = find_max_kulldorff_sweep(tree, population)
-        scan_statistic_values.append(scan_statistic)
+    # iterations are independent, so run them across processes, each with its own random stream
+    seeds = np.random.SeedSequence().spawn(iter)
+    scan_statistic_values = Parallel(n_jobs=n_jobs, backend="loky")(
+        delayed(_one_mc_iteration)(lambda_background, population, seed)
+        for seed in seeds
+    )
 
     # return (1-significance_level) percentile value
-    return np.percentile(scan_statistic_values, 1 - significance_level)
+    return np.percentile(scan_statistic_values, 100 * (1 - significance_level))
 
 
 def find_max_kulldorff_sweep(
@@ -41,32 +49,35 @@ def find_max_kulldorff_sweep(
     total_count = root.count
 
     # area of entire space under consideration
-    total_area = geometry.box(*root.rect).area
-
-    max_scan_statistic = None
-    max_region = None
+    total_area = (root.rect.xmax - root.rect.xmin) * (root.rect.ymax - root.rect.ymin)
 
-    # sweep a circle across the space
-    for x in center_xs:
-        for y in center_ys:
-            for radius in radii:
-                # create circular region at (x,y) of radius
-                region = geometry.Point(x, y).buffer(radius)
-                # estimate the count inside using quadtree
-                est_count_inside = root.count_inside(region)
-                # TODO: assumption
-                # assume population is distributed uniformly to estimate population
-                est_population_inside = (region.area / total_area) * population
-
-                scan_statistic = kulldorff_scan_statistic(
-                    est_count_inside, est_population_inside, total_count, population
-                )
+    # enumerate every (x, y, radius) combination in the same order as a nested sweep
+    cx, cy, r = (
+        grid.ravel() for grid in np.meshgrid(center_xs, center_ys, radii, indexing="ij")
+    )
 
-                if max_scan_statistic is None or scan_statistic > max_scan_statistic:
-                    max_scan_statistic = scan_statistic
-                    max_region = ((x, y), radius)
+    # TODO: assumption
+    # assume population is distributed uniformly to estimate population
+    population_per_unit_area = population / total_area
+    est_populations_inside = population_per_unit_area * np.pi * r * r
+
+    # estimate the count inside each circular region that could be the max using quadtree
+    scan_statistics = sweep_circles(
+        root,
+        cx,
+        cy,
+        r,
+        lambda est_counts_inside, selection: kulldorff_scan_statistic(
+            est_counts_inside,
+            est_populations_inside[selection],
+            total_count,
+            population,
+        ),
+    )
 
-    return max_scan_statistic, max_region
+    # noisy counts can exceed the total count, leaving the statistic undefined; skip those regions
+    best = np.nanargmax(scan_statistics)
+    return scan_statistics[best], ((cx[best], cy[best]), r[best])
 
 
 def kulldorff_scan_statistic(
@@ -75,6 +86,7 @@ def kulldorff_scan_statistic(
     """Computes the log-Kulldorff scan statistic.
 
     To avoid floating-point overflow, computes the logarithm of the Kulldorff scan statistic.
+    Accepts either scalars or arrays for the inside counts and populations.
 
     Args:
         c_in (float): Case count inside the region.
@@ -88,11 +100,11 @@ def kulldorff_scan_statistic(
     c_out = c_all - c_in
     b_out = b_all - b_in
 
-    if (c_in / b_in) <= (c_out / b_out):
-        return 0
-
-    return (
-        c_in * np.log(c_in / b_in)
-        + c_out * np.log(c_out / b_out)
-        - c_all * np.log(c_all / b_all)
-    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(
+            (c_in / b_in) > (c_out / b_out),
+            c_in * np.log(c_in / b_in)
+            + c_out * np.log(c_out / b_out)
+            - c_all * np.log(c_all / b_all),
+            0.0,
+        )
@@ -14,3 +14,8 @@ class Rectangle(typing.NamedTuple):
 class Point(typing.NamedTuple):
     x: float
     y: float
+
+
+class Circle(typing.NamedTuple):
+    center: Point
+    radius: float
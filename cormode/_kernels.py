@@ -0,0 +1,159 @@
+"""Compiled kernels for hot loops over flattened quadtrees.
+
+Numba is an optional dependency. When it is not installed, every kernel in this module is None
+and callers fall back to their NumPy implementations.
+"""
+
+import math
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+if numba is not None:
+
+    @numba.njit(cache=True)
+    def _quadrant_area(a, b, r):
+        # area of [0, a] x [0, b] intersected with a circle of radius r centered at the origin
+        a = min(a, r)
+        b = min(b, r)
+        x_cross = min(math.sqrt(max(r * r - b * b, 0.0)), a)
+        area_a = 0.5 * (
+            a * math.sqrt(max(r * r - a * a, 0.0))
+            + r * r * math.asin(min(max(a / r, -1.0), 1.0))
+        )
+        area_cross = 0.5 * (
+            x_cross * math.sqrt(max(r * r - x_cross * x_cross, 0.0))
+            + r * r * math.asin(min(max(x_cross / r, -1.0), 1.0))
+        )
+        return b * x_cross + area_a - area_cross
+
+    @numba.njit(cache=True)
+    def _signed_area(x, y, r):
+        return np.sign(x) * np.sign(y) * _quadrant_area(abs(x), abs(y), r)
+
+    @numba.njit(cache=True)
+    def _circle_rect_intersection_area(cx, cy, r, xmin, ymin, xmax, ymax):
+        xmin, xmax = xmin - cx, xmax - cx
+        ymin, ymax = ymin - cy, ymax - cy
+        return (
+            _signed_area(xmax, ymax, r)
+            - _signed_area(xmin, ymax, r)
+            - _signed_area(xmax, ymin, r)
+            + _signed_area(xmin, ymin, r)
+        )
+
+    @numba.njit(cache=True, parallel=True)
+    def count_inside_circles(
+        xmin, ymin, xmax, ymax, count, is_leaf, height, cx, cy, r, out
+    ):
+        """Writes the estimated count inside each circle to out.
+
+        Tree arrays are laid out as in QuadTreeArrays; each circle is resolved with an
+        explicit depth-first stack over node indices.
+        """
+        for q in numba.prange(cx.size):
+            x, y, r2 = cx[q], cy[q], r[q] * r[q]
+
+            # each level pushes at most three siblings that are still waiting
+            stack = np.empty(4 * (height + 1), np.int64)
+            stack[0] = 0
+            top = 1
+            total = 0.0
+
+            while top > 0:
+                top -= 1
+                i = stack[top]
+
+                # farthest corner inside circle: box is completely contained
+                dx = max(abs(x - xmin[i]), abs(x - xmax[i]))
+                dy = max(abs(y - ymin[i]), abs(y - ymax[i]))
+                if dx * dx + dy * dy <= r2:
+                    total += count[i]
+                    continue
+
+                # closest point outside circle: box is disjoint
+                dx = x - min(max(x, xmin[i]), xmax[i])
+                dy = y - min(max(y, ymin[i]), ymax[i])
+                if dx * dx + dy * dy >= r2:
+                    continue
+
+                if is_leaf[i]:
+                    # use uniformity assumption to estimate the count contained in the intersection
+                    box_area = (xmax[i] - xmin[i]) * (ymax[i] - ymin[i])
+                    intersection_area = _circle_rect_intersection_area(
+                        x, y, r[q], xmin[i], ymin[i], xmax[i], ymax[i]
+                    )
+                    total += intersection_area / box_area * count[i]
+                else:
+                    for k in range(1, 5):
+                        stack[top] = 4 * i + k
+                        top += 1
+
+            out[q] = total
+
+    @numba.njit(cache=True)
+    def ols_counts(count, epsilon, e_array, fanout, fanout_pow, height, out):
+        """Writes the OLS estimate of every node's count to out.
+
+        Tree arrays are laid out in level order as in QuadTreeArrays, so the parent of node i is
+        (i - 1) // fanout and every child comes after its parent. The three phases of Cormode et al.'s OLS
+        estimator each become a single sweep over node indices.
+        """
+        n = count.size
+        depth = np.zeros(n, np.int64)
+
+        # Phase I: top-down traversal to accumulate alpha along each root-to-node path
+        alpha = epsilon * epsilon * count
+        for i in range(1, n):
+            parent = (i - 1) // fanout
+            alpha[i] += alpha[parent]
+            depth[i] = depth[parent] + 1
+
+        # Phase II: bottom-up traversal; leaves start with their alpha, parents sum their children
+        z = np.zeros(n)
+        for i in range(n - 1, -1, -1):
+            if depth[i] == height:
+                z[i] = alpha[i]
+            if i > 0:
+                z[(i - 1) // fanout] += z[i]
+
+        # Phase III: top-down traversal, each node inheriting its parent's F
+        node_F = np.zeros(n)
+        for i in range(n):
+            if i > 0:
+                parent = (i - 1) // fanout
+                node_F[i] = node_F[parent] + out[parent] * epsilon[parent] ** 2
+            node_height = height - depth[i]
+            out[i] = (z[i] - fanout_pow[node_height] * node_F[i]) / e_array[node_height]
+
+    # compile up front on a 2x2 tree so the first real call doesn't pay for it
+    count_inside_circles(
+        np.array([0.0, 0.5, 0.0, 0.0, 0.5]),
+        np.array([0.0, 0.5, 0.5, 0.0, 0.0]),
+        np.array([1.0, 1.0, 0.5, 0.5, 1.0]),
+        np.array([1.0, 1.0, 1.0, 0.5, 0.5]),
+        np.zeros(5),
+        np.array([False, True, True, True, True]),
+        1,
+        np.array([0.5]),
+        np.array([0.5]),
+        np.array([0.25]),
+        np.empty(1),
+    )
+    ols_counts(
+        np.ones(5),
+        np.ones(5),
+        np.array([1.0, 5.0]),
+        4,
+        np.array([1, 4, 16]),
+        1,
+        np.empty(5),
+    )
+
+else:
+    count_inside_circles = None
+    ols_counts = None
@@ -2,13 +2,141 @@
 """
 
 import typing
+import warnings
+import numpy as np
 from shapely import geometry
-from cormode import Rectangle, Point
+from shapely.errors import ShapelyDeprecationWarning
+from shapely.prepared import PreparedGeometry, prep
+from shapely.strtree import STRtree
+from cormode import Rectangle, Point, Circle, _kernels
+
+
+def _circle_contains_rect(cx, cy, r, rect: Rectangle):
+    """Returns whether each circle fully contains the given rectangle.
+
+    A circle contains a rectangle exactly when the rectangle's farthest corner
+    lies within the circle.
+    """
+    dx = np.maximum(np.abs(cx - rect.xmin), np.abs(cx - rect.xmax))
+    dy = np.maximum(np.abs(cy - rect.ymin), np.abs(cy - rect.ymax))
+    return dx * dx + dy * dy <= r * r
+
+
+def _circle_intersects_rect(cx, cy, r, rect: Rectangle):
+    """Returns whether each circle overlaps the interior of the given rectangle.
+
+    Compares the distance from each circle's center to the closest point in the
+    rectangle against the circle's radius.
+    """
+    dx = cx - np.clip(cx, rect.xmin, rect.xmax)
+    dy = cy - np.clip(cy, rect.ymin, rect.ymax)
+    return dx * dx + dy * dy < r * r
+
+
+def _quadrant_area(a, b, r):
+    """Area of the intersection of [0, a] x [0, b] with a circle of radius r centered at the origin,
+    for a, b >= 0.
+    """
+    a = np.minimum(a, r)
+    b = np.minimum(b, r)
+
+    # x coordinate at which the circle's boundary crosses y = b
+    x_cross = np.minimum(np.sqrt(np.maximum(r * r - b * b, 0.0)), a)
+
+    def antiderivative(x):
+        # integral of sqrt(r^2 - x^2) dx
+        return 0.5 * (
+            x * np.sqrt(np.maximum(r * r - x * x, 0.0))
+            + r * r * np.arcsin(np.clip(x / r, -1.0, 1.0))
+        )
+
+    return b * x_cross + antiderivative(a) - antiderivative(x_cross)
+
+
+def _circle_rect_intersection_area(cx, cy, r, rect: Rectangle):
+    """Computes the area of the intersection of each circle with the given rectangle.
+
+    The rectangle is decomposed into signed boxes spanning from the circle's center to
+    each of its corners, whose intersection areas with the circle are known in closed form.
+    """
+
+    def signed_area(x, y):
+        return np.sign(x) * np.sign(y) * _quadrant_area(np.abs(x), np.abs(y), r)
+
+    xmin, xmax = rect.xmin - cx, rect.xmax - cx
+    ymin, ymax = rect.ymin - cy, rect.ymax - cy
+
+    return (
+        signed_area(xmax, ymax)
+        - signed_area(xmin, ymax)
+        - signed_area(xmax, ymin)
+        + signed_area(xmin, ymin)
+    )
+
+
+def _morton_codes(ix: np.ndarray, iy: np.ndarray) -> np.ndarray:
+    """Interleaves the bits of two arrays of cell indices into Morton (Z-order) codes.
+
+    Bits of ix land in even positions and bits of iy in odd positions, so the two lowest bits
+    of a code identify the quadrant of a cell within its parent: 0=SW, 1=SE, 2=NW, 3=NE.
+    """
+
+    def spread_bits(v):
+        v = v.astype(np.uint64)
+        v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+        v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+        v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+        v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+        v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+        return v
+
+    return spread_bits(ix) | (spread_bits(iy) << np.uint64(1))
+
+
+class QuadTreeArrays(typing.NamedTuple):
+    """Structure-of-arrays view of a quadtree.
+
+    Nodes are laid out level by level (breadth-first), with each node's children in the order
+    (NE, NW, SW, SE). Since quadtrees are complete, the children of node i are nodes 4i+1 through 4i+4.
+    """
+
+    xmin: np.ndarray
+    ymin: np.ndarray
+    xmax: np.ndarray
+    ymax: np.ndarray
+    count: np.ndarray
+    epsilon: np.ndarray
+    is_leaf: np.ndarray
+
+
+class _LeafIndex(typing.NamedTuple):
+    """Spatial index over the leaves of a quadtree, with their counts and areas."""
+
+    tree: STRtree
+    boxes: typing.List[geometry.Polygon]
+    counts: np.ndarray
+    areas: np.ndarray
 
 
 class QuadTreeNode:
+    __slots__ = (
+        "count",
+        "height",
+        "rect",
+        "center",
+        "parent",
+        "child_ne",
+        "child_nw",
+        "child_se",
+        "child_sw",
+        "epsilon",
+        "_box",
+        "_area",
+        "_leaf_index",
+    )
+
     # TODO: question: does rounding this to an integer produce better results?
-    count: float = 0.0
+    count: float
     """Number of points lying inside of this node's rectangle.
     """
 
@@ -27,24 +155,34 @@ class QuadTreeNode:
     parent: typing.Optional["QuadTreeNode"]
     """Parent node of this QuadTreeNode, if it exists.
     """
-    child_ne: typing.Optional["QuadTreeNode"] = None
+    child_ne: typing.Optional["QuadTreeNode"]
     """Northeastern child of this QuadTreeNode, if it exists.
     """
-    child_nw: typing.Optional["QuadTreeNode"] = None
+    child_nw: typing.Optional["QuadTreeNode"]
     """Northwestern child of this QuadTreeNode, if it exists.
     """
-    child_se: typing.Optional["QuadTreeNode"] = None
+    child_se: typing.Optional["QuadTreeNode"]
     """Southeastern child of this QuadTreeNode, if it exists.
     """
-    child_sw: typing.Optional["QuadTreeNode"] = None
+    child_sw: typing.Optional["QuadTreeNode"]
     """Southwestern child of this QuadTreeNode, if it exists.
     """
 
-    epsilon: typing.Optional[float] = None
+    epsilon: typing.Optional[float]
     """Epsilon associated with this level of the tree, if this node has been
     privatized. Used to reduce variance in query responses.
     """
 
+    _box: typing.Optional[geometry.Polygon]
+    """Shapely box of this node's rectangle, built on first use.
+    """
+    _area: float
+    """Area of this node's rectangle.
+    """
+    _leaf_index: typing.Optional[_LeafIndex]
+    """Spatial index over the leaves below this node, if it has been built.
+    """
+
     def __init__(
         self,
         rect: Rectangle = Rectangle(0, 0, 1, 1),
@@ -58,10 +196,15 @@ class QuadTreeNode:
             height (int, optional): Number of edges from node to any given leaf. Defaults to 0.
         """
 
+        self.count = 0.0
         self.rect = rect
         self.center = Point((rect.xmin + rect.xmax) / 2, (rect.ymin + rect.ymax) / 2)
         self.height = height
         self.parent = parent
+        self.epsilon = None
+        self._box = None
+        self._area = (rect.xmax - rect.xmin) * (rect.ymax - rect.ymin)
+        self._leaf_index = None
 
         if height > 0:
             self.child_ne = QuadTreeNode(
@@ -104,6 +247,11 @@ class QuadTreeNode:
                 height=height - 1,
                 parent=self,
             )
+        else:
+            self.child_ne = None
+            self.child_nw = None
+            self.child_se = None
+            self.child_sw = None
 
     @property
     def is_leaf(self) -> bool:
@@ -111,6 +259,13 @@ class QuadTreeNode:
         # if any of its children are none, this is a leaf
         return self.child_ne is None
 
+    @property
+    def box(self) -> geometry.Polygon:
+        """Returns this node's rectangle as a Shapely box."""
+        if self._box is None:
+            self._box = geometry.box(*self.rect)
+        return self._box
+
     @property
     def children(self) -> typing.Optional[typing.List["QuadTreeNode"]]:
         if self.is_leaf:
@@ -118,27 +273,93 @@ class QuadTreeNode:
         else:
             return [self.child_ne, self.child_nw, self.child_sw, self.child_se]
 
+    @classmethod
+    def from_points(
+        cls,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        rect: Rectangle = Rectangle(0, 0, 1, 1),
+        height: int = 0,
+    ) -> "QuadTreeNode":
+        """Builds a quadtree of a given height holding the given points.
+
+        Equivalent to calling insert_point on every point, but bins all points at once.
+
+        Args:
+            xs (np.ndarray): X coordinates of points to insert.
+            ys (np.ndarray): Y coordinates of points to insert.
+            rect (Rectangle): Rectangle representing the bounds of the QuadTree. Defaults to Rectangle(0, 0, 1, 1).
+            height (int, optional): Number of edges from root to any given leaf. Defaults to 0.
+
+        Returns:
+            QuadTreeNode: Root of the new QuadTree.
+        """
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        assert np.all((rect.xmin <= xs) & (xs <= rect.xmax)) and np.all(
+            (rect.ymin <= ys) & (ys <= rect.ymax)
+        ), "Point is not in bounds"
+
+        tree = cls(rect=rect, height=height)
+
+        # find the leaf cell of each point; points on the max edge belong to the last cell
+        cells_per_side = 1 << height
+        ix = ((xs - rect.xmin) / (rect.xmax - rect.xmin) * cells_per_side).astype(int)
+        iy = ((ys - rect.ymin) / (rect.ymax - rect.ymin) * cells_per_side).astype(int)
+        ix = np.clip(ix, 0, cells_per_side - 1)
+        iy = np.clip(iy, 0, cells_per_side - 1)
+
+        # siblings have consecutive Morton codes, so each level's counts are sums of groups of four
+        level_counts = [
+            np.bincount(
+                _morton_codes(ix, iy).astype(np.intp), minlength=cells_per_side**2
+            )
+        ]
+        for _ in range(height):
+            level_counts.insert(0, level_counts[0].reshape(-1, 4).sum(axis=1))
+
+        # copy counts into the tree, level by level
+        nodes = [(tree, 0)]
+        for counts in level_counts:
+            next_nodes = []
+            for node, code in nodes:
+                node.count = float(counts[code])
+                if not node.is_leaf:
+                    next_nodes += [
+                        (node.child_sw, 4 * code),
+                        (node.child_se, 4 * code + 1),
+                        (node.child_nw, 4 * code + 2),
+                        (node.child_ne, 4 * code + 3),
+                    ]
+            nodes = next_nodes
+
+        return tree
+
     def insert_point(self, point: Point):
         """Inserts a point into this QuadTree, incrementing the counts of each rectangle it falls into from node to leaf.
 
         Args:
-            point (Point): Point to insert.
+            point (Point): Point to insert. Any (x, y) pair, such as a row of an array of points, is accepted.
         """
-        assert (self.rect.xmin <= point.x <= self.rect.xmax) and (
-            self.rect.ymin <= point.y <= self.rect.ymax
+        x, y = point
+        assert (self.rect.xmin <= x <= self.rect.xmax) and (
+            self.rect.ymin <= y <= self.rect.ymax
         ), "Point is not in bounds"
 
         # increment this count by 1
         self.count += 1
 
+        # any leaf index below this node now holds stale counts
+        self._leaf_index = None
+
         if self.is_leaf:
             # leaves do not need to recurse on children
             return
 
         # is this point east of center vertical line?
-        east = point.x >= self.center.x
+        east = x >= self.center.x
         # is this point north of center horizontal line?
-        north = point.y >= self.center.y
+        north = y >= self.center.y
 
         # recurse on whichever child contains this point
         if north and east:
@@ -150,20 +371,37 @@ class QuadTreeNode:
         else:
             self.child_sw.insert_point(point)
 
-    def count_inside(self, region: geometry.Polygon) -> float:
+    def count_inside(
+        self,
+        region: typing.Union[geometry.Polygon, Circle],
+        prepared_region: typing.Optional[PreparedGeometry] = None,
+    ) -> float:
         """Estimates the number of points inside this QuadTreeNode contained within a given region.
 
+        Circles are handled analytically; any other region is handled with Shapely.
+
         Args:
-            region (geometry.Polygon): Region to count points within.
+            region (typing.Union[geometry.Polygon, Circle]): Region to count points within.
+            prepared_region (PreparedGeometry, optional): Prepared version of region, reused across recursive calls.
+                Built from region if not given.
 
         Returns:
             float: Estimated number of this QuadTreeNode's points inside region.
         """
+        if isinstance(region, Circle):
+            return self._count_inside_circle(
+                region.center[0], region.center[1], region.radius
+            )
+
+        # prepare the region once so containment tests at every node are fast
+        if prepared_region is None:
+            prepared_region = prep(region)
+
         # represent this region's rectangle as a Shapely box.
-        box = geometry.box(*self.rect)
+        box = self.box
 
         # is this box completely contained within the region?
-        if region.contains(box):
+        if prepared_region.contains(box):
             # return this entire count
             return self.count
         else:
@@ -173,9 +411,258 @@ class QuadTreeNode:
             if self.is_leaf:
                 # leaf: cannot recurse deeper
                 # use uniformity assumption to estimate the count contained in the intersection
+                # (prepared geometries don't support intersection, so use the original region)
                 intersection_area = region.intersection(box).area
-                area_fraction = intersection_area / box.area
+                area_fraction = intersection_area / self._area
 
                 return area_fraction * self.count
             else:
-                return sum(child.count_inside(region) for child in self.children)
+                return (
+                    self.child_ne.count_inside(region, prepared_region)
+                    + self.child_nw.count_inside(region, prepared_region)
+                    + self.child_sw.count_inside(region, prepared_region)
+                    + self.child_se.count_inside(region, prepared_region)
+                )
+
+    def build_leaf_index(self):
+        """Builds an STRtree over the leaves below this node, for use by count_inside_indexed.
+
+        The index snapshots the leaves' counts, so it must be rebuilt if counts change. Inserting
+        a point through this node discards the index.
+        """
+        leaves = [node for node in self.level_order() if node.is_leaf]
+        boxes = [leaf.box for leaf in leaves]
+
+        # this relies on the Shapely 1.x STRtree and its query_items, which warn about the 2.0 API change
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", ShapelyDeprecationWarning)
+            tree = STRtree(boxes)
+
+        self._leaf_index = _LeafIndex(
+            tree=tree,
+            boxes=boxes,
+            counts=np.array([leaf.count for leaf in leaves], dtype=float),
+            areas=np.array([leaf._area for leaf in leaves], dtype=float),
+        )
+
+    def count_inside_indexed(self, region: geometry.Polygon) -> float:
+        """Estimates the number of points inside this QuadTreeNode contained within a given region,
+        using a spatial index over its leaves.
+
+        Only leaves whose bounding boxes overlap the region are visited, so this is suited to sweeping
+        many arbitrary polygons over a fixed tree. Since only leaf counts are used, the result matches
+        count_inside for trees whose counts are consistent (e.g., non-private or OLS trees), but not
+        for privatized trees.
+
+        build_leaf_index must be called first, and again whenever the tree's counts change.
+
+        Args:
+            region (geometry.Polygon): Region to count points within.
+
+        Returns:
+            float: Estimated number of this QuadTreeNode's points inside region.
+        """
+        assert (
+            self._leaf_index is not None
+        ), "Call build_leaf_index before count_inside_indexed."
+        index = self._leaf_index
+
+        candidates = index.tree.query_items(region)
+        prepared_region = prep(region)
+
+        # leaves fully inside the region count entirely; the rest by uniformity assumption
+        area_fractions = np.array(
+            [
+                1.0
+                if prepared_region.contains(index.boxes[i])
+                else region.intersection(index.boxes[i]).area / index.areas[i]
+                for i in candidates
+            ],
+            dtype=float,
+        )
+        return float(
+            np.dot(area_fractions, index.counts[np.asarray(candidates, dtype=np.intp)])
+        )
+
+    def _count_inside_circle(self, cx: float, cy: float, r: float) -> float:
+        # is this box completely contained within the circle?
+        if _circle_contains_rect(cx, cy, r, self.rect):
+            return self.count
+
+        # circles disjoint from this box contribute nothing
+        if not _circle_intersects_rect(cx, cy, r, self.rect):
+            return 0.0
+
+        if self.is_leaf:
+            # use uniformity assumption to estimate the count contained in the intersection
+            intersection_area = _circle_rect_intersection_area(cx, cy, r, self.rect)
+            return float(intersection_area / self._area) * self.count
+        else:
+            return (
+                self.child_ne._count_inside_circle(cx, cy, r)
+                + self.child_nw._count_inside_circle(cx, cy, r)
+                + self.child_sw._count_inside_circle(cx, cy, r)
+                + self.child_se._count_inside_circle(cx, cy, r)
+            )
+
+    def count_inside_circles(
+        self, cx, cy, r, arrays: typing.Optional[QuadTreeArrays] = None
+    ) -> np.ndarray:
+        """Estimates the number of points inside this QuadTreeNode contained within each of a batch of circles.
+
+        Equivalent to calling count_inside once per circle, but walks the tree once for the whole batch
+        and uses exact circle geometry in place of Shapely's polygonal approximation.
+
+        Args:
+            cx (np.ndarray): X coordinates of circle centers.
+            cy (np.ndarray): Y coordinates of circle centers.
+            r (np.ndarray): Radii of circles.
+            arrays (QuadTreeArrays, optional): Result of to_soa() for this QuadTreeNode, so that callers making
+                several queries against an unchanged tree only flatten it once. Built from this node if not given.
+
+        Returns:
+            np.ndarray: Estimated number of this QuadTreeNode's points inside each circle, shaped like cx.
+        """
+        cx, cy, r = np.broadcast_arrays(
+            np.asarray(cx, dtype=float),
+            np.asarray(cy, dtype=float),
+            np.asarray(r, dtype=float),
+        )
+        shape = cx.shape
+        cx, cy, r = cx.ravel(), cy.ravel(), r.ravel()
+
+        tree = self.to_soa() if arrays is None else arrays
+
+        if _kernels.count_inside_circles is not None:
+            counts = np.empty(cx.size)
+            _kernels.count_inside_circles(
+                tree.xmin,
+                tree.ymin,
+                tree.xmax,
+                tree.ymax,
+                tree.count,
+                tree.is_leaf,
+                self.height,
+                cx,
+                cy,
+                r,
+                counts,
+            )
+            return counts.reshape(shape)
+
+        counts = np.zeros(cx.size)
+
+        # (node, circle) pairs left to resolve, starting with the root against every circle
+        nodes = np.zeros(cx.size, dtype=np.intp)
+        circles = np.arange(cx.size)
+
+        while nodes.size > 0:
+            rects = Rectangle(
+                tree.xmin[nodes], tree.ymin[nodes], tree.xmax[nodes], tree.ymax[nodes]
+            )
+            qx, qy, qr = cx[circles], cy[circles], r[circles]
+
+            # circles completely containing a box take its entire count
+            contained = _circle_contains_rect(qx, qy, qr, rects)
+            counts += np.bincount(
+                circles[contained],
+                weights=tree.count[nodes[contained]],
+                minlength=cx.size,
+            )
+
+            # circles disjoint from a box contribute nothing; the rest straddle its boundary
+            partial = ~contained & _circle_intersects_rect(qx, qy, qr, rects)
+
+            # leaf: use uniformity assumption to estimate the count contained in the intersection
+            leaf = partial & tree.is_leaf[nodes]
+            leaf_rects = Rectangle(*(bound[leaf] for bound in rects))
+            area_fraction = _circle_rect_intersection_area(
+                qx[leaf], qy[leaf], qr[leaf], leaf_rects
+            ) / (
+                (leaf_rects.xmax - leaf_rects.xmin)
+                * (leaf_rects.ymax - leaf_rects.ymin)
+            )
+            counts += np.bincount(
+                circles[leaf],
+                weights=area_fraction * tree.count[nodes[leaf]],
+                minlength=cx.size,
+            )
+
+            # internal node: resolve against each of its four children on the next level
+            descend = partial & ~tree.is_leaf[nodes]
+            nodes = (4 * nodes[descend, np.newaxis] + np.arange(1, 5)).ravel()
+            circles = np.repeat(circles[descend], 4)
+
+        return counts.reshape(shape)
+
+    def count_inside_upper_bound(
+        self,
+        cx,
+        cy,
+        r,
+        depth: int = 2,
+        arrays: typing.Optional[QuadTreeArrays] = None,
+    ) -> np.ndarray:
+        """Bounds from above the number of points inside each of a batch of circles, by summing
+        the counts of the nodes at a given depth that overlap each circle.
+
+        Only a valid bound when counts are nonnegative and each node's count is the sum of its
+        children's counts, as in non-private QuadTrees.
+
+        Args:
+            cx (np.ndarray): X coordinates of circle centers.
+            cy (np.ndarray): Y coordinates of circle centers.
+            r (np.ndarray): Radii of circles.
+            depth (int, optional): Depth of nodes to sum counts over. Defaults to 2.
+            arrays (QuadTreeArrays, optional): Result of to_soa() for this QuadTreeNode. Built from this node if not given.
+
+        Returns:
+            np.ndarray: Upper bound on the number of this QuadTreeNode's points inside each circle, shaped like cx.
+        """
+        cx, cy, r = np.broadcast_arrays(
+            np.asarray(cx, dtype=float),
+            np.asarray(cy, dtype=float),
+            np.asarray(r, dtype=float),
+        )
+
+        # nodes at this depth are laid out contiguously in level order
+        depth = min(depth, self.height)
+        start = (4**depth - 1) // 3
+        level = slice(start, start + 4**depth)
+
+        tree = self.to_soa() if arrays is None else arrays
+        rects = Rectangle(
+            tree.xmin[level], tree.ymin[level], tree.xmax[level], tree.ymax[level]
+        )
+        overlaps = _circle_intersects_rect(
+            cx[..., np.newaxis], cy[..., np.newaxis], r[..., np.newaxis], rects
+        )
+        return overlaps @ tree.count[level]
+
+    def level_order(self) -> typing.List["QuadTreeNode"]:
+        """Returns every node of this QuadTree, level by level from the root."""
+        nodes = [self]
+        for node in nodes:
+            nodes += node.children
+        return nodes
+
+    def to_soa(self) -> QuadTreeArrays:
+        """Flattens this QuadTree into parallel NumPy arrays.
+
+        Returns:
+            QuadTreeArrays: Bounds, counts, epsilons and leaf flags of every node, in level order.
+            Epsilons of non-private nodes are NaN.
+        """
+        nodes = self.level_order()
+        return QuadTreeArrays(
+            xmin=np.array([node.rect.xmin for node in nodes], dtype=float),
+            ymin=np.array([node.rect.ymin for node in nodes], dtype=float),
+            xmax=np.array([node.rect.xmax for node in nodes], dtype=float),
+            ymax=np.array([node.rect.ymax for node in nodes], dtype=float),
+            count=np.array([node.count for node in nodes], dtype=float),
+            epsilon=np.array(
+                [np.nan if node.epsilon is None else node.epsilon for node in nodes],
+                dtype=float,
+            ),
+            is_leaf=np.array([node.is_leaf for node in nodes], dtype=bool),
+        )
@@ -3,7 +3,13 @@
 import numpy as np
 
 
-def laplace_mechanism(val: float, sensitivity: float, epsilon: float):
+# module-wide random stream; SFC64 is the fastest of NumPy's bit generators
+_rng = np.random.Generator(np.random.SFC64())
+
+
+def laplace_mechanism(
+    val: float, sensitivity: float, epsilon: float, rng: np.random.Generator = None
+):
     """Applies Laplace mechanism to a value, returning a prviatized version suitable for release.
 
     See section 3.3 of Dwork & Roth, "The Algorithmic Foundations of Differential Privacy" for more information.
@@ -11,7 +17,10 @@ def laplace_mechanism(val: float, sensitivity: float, epsilon: float):
     Args:
         val (np.ndarray): Vector to add noise to.
         sensitivity (float): Sensitivity of corresponding function. See section 3.3 of Dwork & Roth for more information.
-        epsilon (float): Privacy parameter.
+        epsilon (float): Privacy parameter. May be an array matching val to use a different value per entry.
+        rng (np.random.Generator, optional): Source of randomness. Defaults to a module-wide generator.
     """
+    if rng is None:
+        rng = _rng
 
-    return val + np.random.laplace(loc=0.0, scale=(sensitivity / epsilon))
+    return val + rng.laplace(loc=0.0, scale=(sensitivity / epsilon))
@@ -1,31 +1,28 @@
 """Tools for generating test data.
 """
 
-from turtle import shape
-from shapely import geometry
-import numpy as np
 import typing
-from cormode import Point
+from shapely import geometry, ops, vectorized
+import numpy as np
+
+
+# random stream used when callers do not pass their own
+_rng = np.random.Generator(np.random.SFC64())
 
 
 def generate_points_no_cluster(
     entire_region: geometry.Polygon,
     lambda_background: float,
-) -> typing.List[Point]:
-    background_area = entire_region.area
+    rng: np.random.Generator = None,
+) -> np.ndarray:
+    if rng is None:
+        rng = _rng
 
-    points = []
-
-    count = np.random.poisson(lambda_background * background_area)
-    while len(points) < count:
-        point_x = np.random.uniform(entire_region.bounds[0], entire_region.bounds[2])
-        point_y = np.random.uniform(entire_region.bounds[1], entire_region.bounds[3])
+    background_area = entire_region.area
 
-        shapely_point = geometry.Point(point_x, point_y)
-        if entire_region.contains(shapely_point):
-            points.append(Point(point_x, point_y))
+    count = rng.poisson(lambda_background * background_area)
 
-    return points
+    return _sample_uniform(entire_region, count, rng)
 
 
 def generate_points_single_cluster(
@@ -33,7 +30,8 @@ def generate_points_single_cluster(
     lambda_background: float,
     cluster_region: geometry.Polygon,
     lambda_cluster: float,
-) -> typing.List[Point]:
+    rng: np.random.Generator = None,
+) -> np.ndarray:
     """Generates list of points according to a Poisson point process.
 
     Args:
@@ -41,54 +39,183 @@ def generate_points_single_cluster(
         lambda_background (float): Parameter of the Poisson distribution for background case counts per unit area. This will be normalized to reflect the region's area.
         cluster_region (geometry.Polygon): Shapely polygon corresponding to the cluster.
         lambda_cluster (float): Parameter of the Poisson distribution for the cluster. This willl be normalized to reflect the region's area.
+        rng (np.random.Generator, optional): Source of randomness. Defaults to a module-wide generator.
 
     Returns:
-        typing.List[Point]: List of generated points.
+        np.ndarray: Array of generated points, one (x, y) row per point.
     """
 
+    if rng is None:
+        rng = _rng
+
     # make sure cluster region does not extend out of the entire region
     cluster_region = entire_region.intersection(cluster_region)
 
     # compute area of (entire region) - (cluster)
     background_area = entire_region.area - cluster_region.area
 
-    points = []
-
     # how many background points should we generate?
     # we scale the Poisson parameter by the area of the region
-    background_count = np.random.poisson(lambda_background * background_area)
-
-    # hack: instead of doing the math to figure out how to uniformly distribute points within this shape,
-    # we'll just generate points randomly and toss them out if they happen to be in the cluster region.
-    bg_generated = 0
-    while bg_generated < background_count:
-        point_x = np.random.uniform(entire_region.bounds[0], entire_region.bounds[2])
-        point_y = np.random.uniform(entire_region.bounds[1], entire_region.bounds[3])
+    background_count = rng.poisson(lambda_background * background_area)
 
-        shapely_point = geometry.Point(point_x, point_y)
-
-        if entire_region.contains(shapely_point) and not cluster_region.contains(
-            shapely_point
-        ):
-            points.append(Point(point_x, point_y))
-            bg_generated += 1
+    # draw points from the entire region and toss them out if they happen to be in the cluster region.
+    # the cluster is usually small, so few points are rejected.
+    background_points = _sample_uniform(
+        entire_region, background_count, rng, excluded_region=cluster_region
+    )
 
     # how many cluster points should we generate?
     # we scale the Poisson parameter by the area of the region
-    cluster_count = np.random.poisson(lambda_cluster * cluster_region.area)
+    cluster_count = rng.poisson(lambda_cluster * cluster_region.area)
+
+    # cluster points are drawn directly from the cluster's triangulation
+    cluster_points = _sample_uniform_in_polygon(cluster_region, cluster_count, rng)
+
+    return np.concatenate((background_points, cluster_points))
+
+
+class _Triangulation(typing.NamedTuple):
+    """Triangulation of a polygon, laid out for sampling points within it."""
 
-    # same hack here
-    cluster_generated = 0
-    while cluster_generated < cluster_count:
-        point_x = np.random.uniform(cluster_region.bounds[0], cluster_region.bounds[2])
-        point_y = np.random.uniform(cluster_region.bounds[1], cluster_region.bounds[3])
+    origins: np.ndarray
+    """First vertex of each triangle."""
+    edges_b: np.ndarray
+    """Edge from each triangle's first vertex to its second."""
+    edges_c: np.ndarray
+    """Edge from each triangle's first vertex to its third."""
+    probabilities: np.ndarray
+    """Probability of picking each triangle, proportional to its area."""
+    exact: bool
+    """Whether the triangles cover exactly the polygon, so no sample needs to be rejected."""
 
-        shapely_point = geometry.Point(point_x, point_y)
 
-        if entire_region.contains(shapely_point) and cluster_region.contains(
-            shapely_point
-        ):
-            points.append(Point(point_x, point_y))
-            cluster_generated += 1
+def _sample_uniform(
+    region: geometry.Polygon,
+    count: int,
+    rng: np.random.Generator,
+    excluded_region: geometry.Polygon = None,
+) -> np.ndarray:
+    """Samples points uniformly from a region, minus an optional excluded region.
 
-    return points
+    Candidates are drawn in batches from the region and filtered with vectorized
+    containment tests against the excluded region.
+
+    Args:
+        region (geometry.Polygon): Shapely polygon to sample points within.
+        count (int): Number of points to sample.
+        rng (np.random.Generator): Source of randomness.
+        excluded_region (geometry.Polygon, optional): Shapely polygon that sampled points must lie outside of. Defaults to None.
+
+    Returns:
+        np.ndarray: Array of sampled points, one (x, y) row per point.
+    """
+    if count == 0 or region.is_empty:
+        return np.empty((0, 2))
+
+    # every batch is drawn from the same triangles
+    triangulation = _triangulate(region)
+
+    if excluded_region is None:
+        return _sample_uniform_in_polygon(region, count, rng, triangulation)
+
+    batch_size = max(count * 2, 4096)
+    points = [np.empty((0, 2))]
+    generated = 0
+    while generated < count:
+        candidates = _sample_uniform_in_polygon(region, batch_size, rng, triangulation)
+        outside = ~vectorized.contains(
+            excluded_region, candidates[:, 0], candidates[:, 1]
+        )
+
+        points.append(candidates[outside])
+        generated += np.count_nonzero(outside)
+
+    return np.concatenate(points)[:count]
+
+
+def _triangulate(polygon: geometry.Polygon) -> _Triangulation:
+    """Triangulates a non-empty polygon for use by _sample_uniform_in_polygon.
+
+    Args:
+        polygon (geometry.Polygon): Shapely polygon to triangulate.
+
+    Returns:
+        _Triangulation: Triangles of the polygon's Delaunay triangulation and their sampling probabilities.
+    """
+    # (triangle, vertex, coordinate) array of the triangulation
+    triangles = np.array(
+        [triangle.exterior.coords[:3] for triangle in ops.triangulate(polygon)]
+    )
+    origins = triangles[:, 0]
+    edges_b = triangles[:, 1] - origins
+    edges_c = triangles[:, 2] - origins
+    areas = 0.5 * np.abs(edges_b[:, 0] * edges_c[:, 1] - edges_b[:, 1] * edges_c[:, 0])
+
+    # triangulation covers exactly the polygon, so every sample is kept.
+    # the tolerance is purely relative so that small regions (e.g. in degrees) are still filtered
+    exact = bool(np.isclose(areas.sum(), polygon.area, rtol=1e-9, atol=0))
+
+    return _Triangulation(
+        origins=origins,
+        edges_b=edges_b,
+        edges_c=edges_c,
+        probabilities=areas / areas.sum(),
+        exact=exact,
+    )
+
+
+def _sample_uniform_in_polygon(
+    polygon: geometry.Polygon,
+    count: int,
+    rng: np.random.Generator,
+    triangulation: _Triangulation = None,
+) -> np.ndarray:
+    """Samples points uniformly from a polygon using its triangulation.
+
+    Each point picks a triangle with probability proportional to its area, then a uniform
+    position within it from barycentric coordinates. The Delaunay triangulation covers the
+    convex hull of the polygon's vertices, so points landing in concavities or holes are
+    redrawn; convex polygons never reject a point.
+
+    Args:
+        polygon (geometry.Polygon): Shapely polygon to sample points within.
+        count (int): Number of points to sample.
+        rng (np.random.Generator): Source of randomness.
+        triangulation (_Triangulation, optional): Result of _triangulate for polygon, for callers sampling
+            the same polygon repeatedly. Built from polygon if not given.
+
+    Returns:
+        np.ndarray: Array of sampled points, one (x, y) row per point.
+    """
+    if count == 0 or polygon.is_empty:
+        return np.empty((0, 2))
+
+    if triangulation is None:
+        triangulation = _triangulate(polygon)
+    origins, edges_b, edges_c, probabilities, exact = triangulation
+
+    batch_size = count if exact else max(count * 2, 4096)
+    points = [np.empty((0, 2))]
+    generated = 0
+    while generated < count:
+        picked = rng.choice(len(origins), size=batch_size, p=probabilities)
+
+        # reflect points from the far half of the parallelogram back into the triangle
+        u, v = rng.random((2, batch_size))
+        flip = u + v > 1
+        u[flip], v[flip] = 1 - u[flip], 1 - v[flip]
+
+        candidates = (
+            origins[picked]
+            + u[:, np.newaxis] * edges_b[picked]
+            + v[:, np.newaxis] * edges_c[picked]
+        )
+        if not exact:
+            candidates = candidates[
+                vectorized.contains(polygon, candidates[:, 0], candidates[:, 1])
+            ]
+
+        points.append(candidates)
+        generated += len(candidates)
+
+    return np.concatenate(points)[:count]
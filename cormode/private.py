@@ -4,6 +4,7 @@
 from cormode.classical import QuadTreeNode
 from cormode import dp
 import enum
+import numpy as np
 
 
 class BudgetStrategy(enum.Enum):
@@ -21,6 +22,7 @@ def make_private_quadtree(
     nonprivate_root: QuadTreeNode,
     epsilon_total: float,
     budget_strategy: BudgetStrategy = BudgetStrategy.UNIFORM,
+    rng: np.random.Generator = None,
 ) -> QuadTreeNode:
     """Converts a non-private quadtree to a private one by perturbing the counts at each level.
 
@@ -28,6 +30,7 @@ def make_private_quadtree(
         nonprivate_root (QuadTreeNode): Root QuadTreeNode of the original, non-private tree.
         epsilon (float): Privacy parameter.
         budget_strategy (BudgetStrategy, optional): Strategy for distributing our privacy budget across levels of the tree. Defaults to BudgetStrategy.UNIFORM.
+        rng (np.random.Generator, optional): Source of randomness for the Laplace noise. Defaults to the generator used by dp.laplace_mechanism.
 
     Returns:
         QuadTreeNode: A new QuadTreeNode whose privatized counts are derived from the original QuadTreeNode.
@@ -45,41 +48,56 @@ def make_private_quadtree(
 
     height = nonprivate_root.height
 
-    # now, privatizing the tree is just a matter of setting counts based on the nonprivate tree
-
-    def set_counts(nonprivate_node, private_node, depth=0):
-        # compute the value of epsilon for this level
-
-        # TODO: test that the budget strategies actually result in root-to-leaf sum of level epsilons <= epsilon_total
-        if budget_strategy == BudgetStrategy.UNIFORM:
-            # each level's epsilon is equal
-            level_epsilon = epsilon_total / (height + 1)
-        elif budget_strategy == BudgetStrategy.GEOMETRIC:
-            # ugly formula, taken from Cormode et al. pp. 5
-            level_epsilon = (
-                2 ** (depth / 3)
-                * epsilon_total
-                * ((2 ** (1 / 3) - 1) / (2 ** ((height + 1) / 3) - 1))
-            )
-        else:
-            raise NotImplementedError(
-                f"Invalid noise budget strategy '{budget_strategy}'"
-            )
-
-        # set this node's count based on laplace mechanism
-        private_node.count = dp.laplace_mechanism(
-            nonprivate_node.count, sensitivity=1, epsilon=level_epsilon
-        )
+    # compute the value of epsilon for each level
+    level_epsilons = _level_epsilons(epsilon_total, height, budget_strategy)
 
-        # keep track of this node's epsilon
-        private_node.epsilon = level_epsilon
+    # now, privatizing the tree is just a matter of setting counts based on the nonprivate tree.
+    # in level order, depth d is held by the next 4^d nodes, so all the noise is drawn in one call
+    node_epsilons = np.repeat(level_epsilons, 4 ** np.arange(height + 1))
+    nonprivate_counts = np.array(
+        [node.count for node in nonprivate_root.level_order()], dtype=float
+    )
+    private_counts = dp.laplace_mechanism(
+        nonprivate_counts, sensitivity=1, epsilon=node_epsilons, rng=rng
+    )
 
-        # if there are children:
-        if not private_node.is_leaf:
-            # recurse on each of them
-            for children in zip(nonprivate_node.children, private_node.children):
-                set_counts(*children, depth=depth + 1)
+    for private_node, node_count, node_epsilon in zip(
+        private_root.level_order(), private_counts, node_epsilons
+    ):
+        private_node.count = float(node_count)
 
-    set_counts(nonprivate_root, private_root)
+        # keep track of this node's epsilon
+        private_node.epsilon = float(node_epsilon)
 
     return private_root
+
+
+def _level_epsilons(
+    epsilon_total: float, height: int, budget_strategy: BudgetStrategy
+) -> np.ndarray:
+    """Splits the privacy budget across the levels of a tree.
+
+    Args:
+        epsilon_total (float): Privacy parameter for the entire tree.
+        height (int): Height of the tree.
+        budget_strategy (BudgetStrategy): Strategy for distributing the budget across levels.
+
+    Returns:
+        np.ndarray: Value of epsilon at each depth, starting from the root.
+    """
+    depths = np.arange(height + 1)
+
+    # TODO: test that the budget strategies actually result in root-to-leaf sum of level epsilons <= epsilon_total
+    if budget_strategy == BudgetStrategy.UNIFORM:
+        # each level's epsilon is equal
+        return np.full(height + 1, epsilon_total / (height + 1))
+    elif budget_strategy == BudgetStrategy.GEOMETRIC:
+        # ugly formula, taken from Cormode et al. pp. 5
+        # deeper levels get larger shares, so leaves are the least noisy
+        return (
+            2 ** (depths / 3)
+            * epsilon_total
+            * ((2 ** (1 / 3) - 1) / (2 ** ((height + 1) / 3) - 1))
+        )
+    else:
+        raise NotImplementedError(f"Invalid noise budget strategy '{budget_strategy}'")
@@ -1,7 +1,11 @@
 """Utility functions that don't fit elsewhere.
 """
 
+import typing
+
+import numpy as np
 from shapely import geometry
+from shapely.prepared import prep
 
 
 def intersection_over_union(
@@ -16,8 +20,97 @@ def intersection_over_union(
     Returns:
         float: Ratio of (area of A intersect B) / (area of A union B)
     """
-    return region_a.intersection(region_b).area / region_a.union(region_b).area
+    return iou_with_areas(region_a, region_b, region_a.area, region_b.area)
+
+
+def iou_with_areas(
+    region_a: geometry.Polygon,
+    region_b: geometry.Polygon,
+    area_a: float,
+    area_b: float,
+) -> float:
+    """Computes the intersection-over-union (IoU) of two Shapely regions with known areas.
+
+    Useful when the same regions are compared many times, so their areas can be computed once.
+
+    Args:
+        region_a (geometry.Polygon): First region.
+        region_b (geometry.Polygon): Second region.
+        area_a (float): Area of the first region.
+        area_b (float): Area of the second region.
+
+    Returns:
+        float: Ratio of (area of A intersect B) / (area of A union B)
+    """
+    # empty regions (e.g. from an earlier intersection) have no bounds and overlap nothing
+    if region_a.is_empty or region_b.is_empty:
+        return 0.0
+
+    # disjoint bounding boxes: regions cannot overlap
+    a_xmin, a_ymin, a_xmax, a_ymax = region_a.bounds
+    b_xmin, b_ymin, b_xmax, b_ymax = region_b.bounds
+    if a_xmax < b_xmin or b_xmax < a_xmin or a_ymax < b_ymin or b_ymax < a_ymin:
+        return 0.0
+
+    intersection_area = region_a.intersection(region_b).area
+    if intersection_area == 0.0:
+        return 0.0
+
+    # area(A union B) = area(A) + area(B) - area(A intersect B), which saves computing the union
+    return intersection_area / (area_a + area_b - intersection_area)
+
+
+def iou_batch(
+    region_a: geometry.Polygon, regions_b: typing.Sequence[geometry.Polygon]
+) -> np.ndarray:
+    """Computes the intersection-over-union (IoU) of one Shapely region against many.
+
+    Args:
+        region_a (geometry.Polygon): Region shared by every pair, e.g. a detected cluster.
+        regions_b (typing.Sequence[geometry.Polygon]): Regions to compare against.
+
+    Returns:
+        np.ndarray: IoU of region_a with each region in regions_b.
+    """
+    # prepare region_a once so disjoint regions are rejected without clipping
+    prepared_a = prep(region_a)
+    area_a = region_a.area
+
+    ious = np.zeros(len(regions_b))
+    for i, region_b in enumerate(regions_b):
+        if prepared_a.intersects(region_b):
+            ious[i] = iou_with_areas(region_a, region_b, area_a, region_b.area)
+
+    return ious
 
 
 def make_shapely_circle(center, radius):
     return geometry.Point(center).buffer(radius)
+
+
+def make_shapely_circles(
+    centers_xy: np.ndarray, radii: np.ndarray, resolution: int = 16
+) -> typing.List[geometry.Polygon]:
+    """Builds many circular Shapely polygons at once.
+
+    Vertices for every circle are computed in one NumPy expression, so GEOS only has to wrap
+    ready-made coordinates instead of buffering each point.
+
+    Args:
+        centers_xy (np.ndarray): Array of circle centers, one (x, y) row per circle.
+        radii (np.ndarray): Radius of each circle. A scalar applies to every circle.
+        resolution (int, optional): Number of segments per quarter circle, as in Shapely's buffer. Defaults to 16.
+
+    Returns:
+        typing.List[geometry.Polygon]: Polygon approximating each circle.
+    """
+    centers_xy = np.asarray(centers_xy, dtype=float).reshape(-1, 2)
+    radii = np.broadcast_to(np.asarray(radii, dtype=float), len(centers_xy))
+
+    # (circle, vertex) arrays of coordinates around the unit circle, scaled and shifted per circle
+    angles = np.linspace(0, 2 * np.pi, 4 * resolution, endpoint=False)
+    xs = centers_xy[:, 0, np.newaxis] + radii[:, np.newaxis] * np.cos(angles)
+    ys = centers_xy[:, 1, np.newaxis] + radii[:, np.newaxis] * np.sin(angles)
+    vertices = np.stack((xs, ys), axis=-1)
+
+    return [geometry.Polygon(circle_vertices) for circle_vertices in vertices]